@@ -4,19 +4,33 @@
 # - Catalogue, upload with OCR, PDF generation, testimonials, accessibility
 # - Multi-page nav: Home, Quotation, Catalogue, Upload & OCR, Testimonials, Settings
 
-import io, os, json
+import io, os, json, time
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
 import streamlit as st
+import numpy as np
 import pandas as pd
-from PIL import Image
 
 try:
     import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util import Retry
 except Exception:
     requests = None
 
+try:
+    from orjson import loads as _json_loads
+except Exception:
+    _json_loads = json.loads
+
+try:
+    from numba import njit, prange
+except Exception:
+    njit = None
+
 APP_TITLE = "Gold Ornament Quotation & Price Predictor"
 DEFAULT_CURRENCY = "INR"
 
@@ -31,74 +45,179 @@ SUPPORTED_LANGS = {
 FREE_GOLD_API = "https://www.metals-api.com/api/latest"
 PAID_GOLD_API = "https://www.goldapi.io/api/XAU/INR"
 
-@st.cache_data(ttl=600)
-def fetch_gold_rate(config: Dict[str, Any]) -> Dict[str, Any]:
+# Reciprocal of troy-ounce grams: multiply instead of dividing per fetch.
+_G_PER_OZ_INV = 1.0 / 31.1034768
+
+KARAT_CHOICES = (24, 22, 20, 18, 14)
+_KARAT_IDX = {k: i for i, k in enumerate(KARAT_CHOICES)}
+
+_LANG_NAMES = tuple(SUPPORTED_LANGS.keys())
+_CURRENCIES = ("INR", "USD", "AED", "EUR")
+
+@st.cache_resource
+def _http_session():
+    # One pooled Session per Streamlit process, shared across user
+    # sessions; cache_resource is the idiom for unserializable clients.
+    s = requests.Session()
+    s.headers['Accept'] = 'application/json'
+    adapter = HTTPAdapter(
+        pool_connections=2, pool_maxsize=8,
+        max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=(502, 503, 504)),
+    )
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+def _fetch_paid(config: Dict[str, Any]) -> Dict[str, Any]:
+    per_gram = None
+    # Store the cheap epoch float; render an ISO string only where shown.
+    meta = {"source": "paid", "ts": time.time()}
+    try:
+        headers = {"x-access-token": config.get("api_key", "")}
+        url = PAID_GOLD_API.replace("INR", config.get("base_currency", DEFAULT_CURRENCY))
+        r = _http_session().get(url, headers=headers, timeout=10)
+        if r.ok:
+            price_per_oz = _json_loads(r.content).get("price")
+            if price_per_oz:
+                per_gram = price_per_oz * _G_PER_OZ_INV
+                meta["provider"] = "goldapi.io"
+    except Exception as e:
+        meta["error"] = str(e)
+    return {"per_gram": per_gram, "meta": meta}
+
+
+def _fetch_free(config: Dict[str, Any]) -> Dict[str, Any]:
     per_gram = None
-    meta = {"source": config.get("source"), "timestamp": datetime.utcnow().isoformat()}
+    meta = {"source": "free", "ts": time.time()}
     try:
-        if config.get("source") == "paid" and requests:
-            headers = {"x-access-token": config.get("api_key", "")}
-            url = PAID_GOLD_API.replace("INR", config.get("base_currency", DEFAULT_CURRENCY))
-            r = requests.get(url, headers=headers, timeout=10)
-            if r.ok:
-                price_per_oz = r.json().get("price")
-                if price_per_oz:
-                    per_gram = price_per_oz / 31.1034768
-                    meta["provider"] = "goldapi.io"
-        elif requests:
-            r = requests.get(FREE_GOLD_API, params={
-                "access_key": config.get("api_key", ""),
-                "base": config.get("base_currency", DEFAULT_CURRENCY),
-                "symbols": "XAU",
-            }, timeout=10)
-            if r.ok:
-                xau_rate = r.json().get("rates", {}).get("XAU")
-                if xau_rate:
-                    price_per_oz = 1 / xau_rate
-                    per_gram = price_per_oz / 31.1034768
-                    meta["provider"] = "metals-api"
+        r = _http_session().get(FREE_GOLD_API, params={
+            "access_key": config.get("api_key", ""),
+            "base": config.get("base_currency", DEFAULT_CURRENCY),
+            "symbols": "XAU",
+        }, timeout=10)
+        if r.ok:
+            xau_rate = _json_loads(r.content).get("rates", {}).get("XAU")
+            if xau_rate:
+                per_gram = _G_PER_OZ_INV / xau_rate
+                meta["provider"] = "metals-api"
     except Exception as e:
         meta["error"] = str(e)
     return {"per_gram": per_gram, "meta": meta}
 
 
+@st.cache_data(ttl=600)
+def fetch_gold_rate(config: Dict[str, Any]) -> Dict[str, Any]:
+    if not requests:
+        return {"per_gram": None, "meta": {"source": config.get("source"), "ts": time.time()}}
+    if config.get("race"):
+        # Fire both providers and keep the first usable rate; hides the
+        # tail latency of a flaky provider behind the other. The shared
+        # API key is only sent to the provider it was configured for.
+        blank_key = {**config, "api_key": ""}
+        paid_cfg = config if config.get("source") == "paid" else blank_key
+        free_cfg = config if config.get("source") != "paid" else blank_key
+        result = None
+        ex = ThreadPoolExecutor(max_workers=2)
+        try:
+            futs = [ex.submit(_fetch_paid, paid_cfg), ex.submit(_fetch_free, free_cfg)]
+            for f in as_completed(futs, timeout=10):
+                res = f.result()
+                if res.get("per_gram"):
+                    return res
+                result = res
+        except FuturesTimeout:
+            pass
+        finally:
+            # No `with` block here: its shutdown(wait=True) would stall
+            # the winning return until the losing provider finishes.
+            ex.shutdown(wait=False, cancel_futures=True)
+        return result or {"per_gram": None, "meta": {"source": "race", "ts": time.time()}}
+    if config.get("source") == "paid":
+        return _fetch_paid(config)
+    return _fetch_free(config)
+
+
 def karat_to_purity(karat: int) -> float:
     return max(0.0, min(1.0, karat / 24.0))
 
 
+_MONEY_TPL: Dict[str, str] = {}
+
+
 def format_money(v: float, currency: str = DEFAULT_CURRENCY) -> str:
-    try:
-        return f"{currency} {v:,.2f}"
-    except Exception:
-        return f"{currency} {v}"
+    tpl = _MONEY_TPL.get(currency)
+    if tpl is None:
+        tpl = _MONEY_TPL.setdefault(currency, currency + " {:,.2f}")
+    return tpl.format(v)
 
 
+# Display label -> PriceBreakdown attribute, in breakdown order.
+_PRICE_ROWS = (
+    ("Gold value", "gold_value"),
+    ("Making charges", "making"),
+    ("Stone cost", "stone_cost"),
+    ("Hallmarking", "hallmarking"),
+    ("Shipping", "shipping"),
+    ("Certification", "certification"),
+    ("Conversion", "conversion"),
+    ("Insurance", "insurance"),
+    ("Discount", "discount"),
+    ("GST", "gst"),
+    ("Advance paid", "advance_paid"),
+    ("Final lock band", "final_lock_band"),
+    ("Final payable", "final_payable"),
+)
+
+
+@dataclass(slots=True)
 class PriceBreakdown:
-    def __init__(self, parts: Dict[str, float]):
-        self.parts = parts
+    gold_value: float
+    making: float
+    stone_cost: float
+    hallmarking: float
+    shipping: float
+    certification: float
+    conversion: float
+    insurance: float
+    discount: float       # stored negative: a credit line
+    gst: float
+    advance_paid: float   # stored negative: a credit line
+    final_lock_band: float
+    final_payable: float
+    _rows: Optional[List[List[Any]]] = field(default=None, init=False, repr=False)
+
     @property
     def subtotal(self) -> float:
-        return sum(v for k, v in self.parts.items() if k not in {"GST"})
+        return (self.gold_value + self.making + self.stone_cost
+                + self.hallmarking + self.shipping + self.certification
+                + self.conversion + self.insurance + self.discount
+                + self.advance_paid + self.final_lock_band + self.final_payable)
+
     @property
     def total(self) -> float:
-        return sum(self.parts.values())
+        return self.subtotal + self.gst
+
     def as_rows(self) -> List[List[Any]]:
-        rows = [["Component", "Amount"]]
-        for k, v in self.parts.items():
-            rows.append([k, format_money(v)])
-        rows.append(["Subtotal", format_money(self.subtotal)])
-        rows.append(["Total", format_money(self.total)])
-        return rows
+        if self._rows is None:
+            rows = [["Component", "Amount"]]
+            for label, attr in _PRICE_ROWS:
+                rows.append([label, format_money(getattr(self, attr))])
+            rows.append(["Subtotal", format_money(self.subtotal)])
+            rows.append(["Total", format_money(self.total)])
+            self._rows = rows
+        return self._rows
 
 
-def compute_price(weight_g: float, karat: int, base_rate_per_g: float,
-                   making_pct: float, making_min: float, stone_cost: float,
-                   hallmarking: float, shipping: float, insurance_pct: float,
-                   certification_fee: float, conversion_fee: float, discount_pct: float,
-                   advance_paid: float, gst_pct: float, final_lock_band: float) -> PriceBreakdown:
-    purity = karat_to_purity(karat)
+def compute_price_parts(weight_g, karat, base_rate_per_g,
+                        making_pct, making_min, stone_cost,
+                        hallmarking, shipping, insurance_pct,
+                        certification_fee, conversion_fee, discount_pct,
+                        advance_paid, gst_pct, final_lock_band) -> Dict[str, Any]:
+    # Vectorized pricing core: weight_g / karat / stone_cost may be scalars
+    # or NumPy arrays, so a whole catalogue is priced in one pass.
+    purity = np.clip(np.asarray(karat) / 24.0, 0.0, 1.0)
     gold_value = weight_g * base_rate_per_g * purity
-    making = max(making_min, gold_value * making_pct / 100)
+    making = np.maximum(making_min, gold_value * making_pct / 100)
     gross_before = gold_value + making + stone_cost + hallmarking + shipping + certification_fee + conversion_fee
     insurance = gross_before * (insurance_pct / 100)
     gross = gross_before + insurance
@@ -106,8 +225,8 @@ def compute_price(weight_g: float, karat: int, base_rate_per_g: float,
     net = gross - discount
     gst = net * (gst_pct / 100)
     total_before_advance = net + gst + final_lock_band
-    final_payable = max(0.0, total_before_advance - advance_paid)
-    parts = {
+    final_payable = np.maximum(0.0, total_before_advance - advance_paid)
+    return {
         "Gold value": gold_value,
         "Making charges": making,
         "Stone cost": stone_cost,
@@ -122,26 +241,150 @@ def compute_price(weight_g: float, karat: int, base_rate_per_g: float,
         "Final lock band": final_lock_band,
         "Final payable": final_payable,
     }
-    return PriceBreakdown(parts)
 
 
+def compute_price(weight_g: float, karat: int, base_rate_per_g: float,
+                   making_pct: float, making_min: float, stone_cost: float,
+                   hallmarking: float, shipping: float, insurance_pct: float,
+                   certification_fee: float, conversion_fee: float, discount_pct: float,
+                   advance_paid: float, gst_pct: float, final_lock_band: float) -> PriceBreakdown:
+    parts = compute_price_parts(weight_g, karat, base_rate_per_g,
+                                making_pct, making_min, stone_cost,
+                                hallmarking, shipping, insurance_pct,
+                                certification_fee, conversion_fee, discount_pct,
+                                advance_paid, gst_pct, final_lock_band)
+    return PriceBreakdown(*(float(parts[label]) for label, _ in _PRICE_ROWS))
+
+
+@st.cache_resource
+def _get_price_kernel():
+    # Compile the batch kernel once per process; ~1 s of JIT cost is paid
+    # on first use, not per rerun. Returns None when numba is missing so
+    # callers fall back to the NumPy path.
+    if njit is None:
+        return None
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def kernel(weight_g, karat, base_rate_per_g, making_pct, making_min,
+               stone_cost, hallmarking, shipping, insurance_pct,
+               certification_fee, conversion_fee, discount_pct,
+               advance_paid, gst_pct, final_lock_band):
+        n = weight_g.shape[0]
+        gold_value = np.empty(n)
+        making = np.empty(n)
+        insurance = np.empty(n)
+        discount = np.empty(n)
+        gst = np.empty(n)
+        final_payable = np.empty(n)
+        for i in prange(n):
+            purity = min(1.0, max(0.0, karat[i] / 24.0))
+            gv = weight_g[i] * base_rate_per_g * purity
+            mk = max(making_min, gv * making_pct * 0.01)
+            gross_before = gv + mk + stone_cost + hallmarking + shipping + certification_fee + conversion_fee
+            ins = gross_before * (insurance_pct * 0.01)
+            gross = gross_before + ins
+            dc = gross * (discount_pct * 0.01)
+            net = gross - dc
+            g = net * (gst_pct * 0.01)
+            fp = max(0.0, net + g + final_lock_band - advance_paid)
+            gold_value[i] = gv
+            making[i] = mk
+            insurance[i] = ins
+            discount[i] = dc
+            gst[i] = g
+            final_payable[i] = fp
+        return gold_value, making, insurance, discount, gst, final_payable
+
+    return kernel
+
+
+def compute_prices_for_catalogue(df: pd.DataFrame, cfg: Dict[str, Any], rate_per_g: float) -> pd.DataFrame:
+    # Quote every SKU in one vectorized pass over the catalogue columns.
+    kernel = _get_price_kernel()
+    if kernel is not None:
+        gold_value, making, insurance, discount, gst, final_payable = kernel(
+            df['Weight_g'].to_numpy(dtype=np.float64),
+            df['Karat'].to_numpy(dtype=np.float64), float(rate_per_g),
+            cfg['making_pct'], cfg['making_min'], 0.0,
+            cfg['hallmarking'], cfg['shipping'], cfg['insurance_pct'],
+            cfg['certification'], cfg['conversion'], cfg['discount_pct'],
+            0.0, cfg['gst_pct'], cfg['final_lock_band'])
+        parts = {
+            "Gold value": gold_value,
+            "Making charges": making,
+            "Stone cost": 0.0,
+            "Hallmarking": cfg['hallmarking'],
+            "Shipping": cfg['shipping'],
+            "Certification": cfg['certification'],
+            "Conversion": cfg['conversion'],
+            "Insurance": insurance,
+            "Discount": -discount,
+            "GST": gst,
+            "Advance paid": 0.0,
+            "Final lock band": cfg['final_lock_band'],
+            "Final payable": final_payable,
+        }
+    else:
+        parts = compute_price_parts(
+            df['Weight_g'].to_numpy(dtype=np.float64),
+            df['Karat'].to_numpy(dtype=np.float64), rate_per_g,
+            cfg['making_pct'], cfg['making_min'], 0.0,
+            cfg['hallmarking'], cfg['shipping'], cfg['insurance_pct'],
+            cfg['certification'], cfg['conversion'], cfg['discount_pct'],
+            0.0, cfg['gst_pct'], cfg['final_lock_band'])
+    out = pd.DataFrame(
+        {k: np.broadcast_to(v, len(df)) for k, v in parts.items()})
+    out.insert(0, "SKU", df['SKU'].to_numpy())
+    return out
+
+
+# Columnar layout with final dtypes: single-pass DataFrame construction,
+# no per-row dict alignment or dtype inference.
+_CATALOGUE_COLUMNS = {
+    "SKU": pd.array(["RNG001", "NCK010", "BRC020"], dtype="string"),
+    "Type": pd.Categorical(["Ring", "Necklace", "Bracelet"]),
+    "Karat": np.array([22, 22, 18], dtype=np.int8),
+    "Weight_g": np.array([6.5, 24.8, 14.2], dtype=np.float32),
+    "Stone": pd.Categorical(["CZ", "Ruby", "Emerald"]),
+    "Image": [
+        "https://images.unsplash.com/photo-1522312346375-d1a52e2b99b3",
+        "https://images.unsplash.com/photo-1520975954732-35dd22f7076b",
+        "https://images.unsplash.com/photo-1603570419963-cb9b8f2d9963",
+    ],
+}
+
+
+@st.cache_data(ttl=86400)
+def _thumb(url: str) -> Optional[bytes]:
+    # Downscaled thumbnail fetched once per day per process, so clients
+    # render from memory instead of each pulling the remote image.
+    if not requests:
+        return None
+    try:
+        r = _http_session().get(url + "?w=200", timeout=5)
+        if r.ok:
+            return r.content
+    except Exception:
+        pass
+    return None
+
+
+@st.cache_data
 def load_public_catalogue() -> pd.DataFrame:
-    data = [
-        {"SKU": "RNG001", "Type": "Ring", "Karat": 22, "Weight_g": 6.5, "Stone": "CZ", "Image": "https://images.unsplash.com/photo-1522312346375-d1a52e2b99b3"},
-        {"SKU": "NCK010", "Type": "Necklace", "Karat": 22, "Weight_g": 24.8, "Stone": "Ruby", "Image": "https://images.unsplash.com/photo-1520975954732-35dd22f7076b"},
-        {"SKU": "BRC020", "Type": "Bracelet", "Karat": 18, "Weight_g": 14.2, "Stone": "Emerald", "Image": "https://images.unsplash.com/photo-1603570419963-cb9b8f2d9963"},
-    ]
-    return pd.DataFrame(data)
+    df = pd.DataFrame(_CATALOGUE_COLUMNS)
+    # SKU-indexed for O(1) .loc lookups; keep the column for display.
+    return df.set_index("SKU", drop=False)
 
 
 def sidebar_config():
     st.sidebar.header("Configuration")
-    lang_name = st.sidebar.selectbox("Language", list(SUPPORTED_LANGS.keys()), index=0)
+    lang_name = st.sidebar.selectbox("Language", _LANG_NAMES, index=0)
     lang_code = SUPPORTED_LANGS[lang_name]
     st.sidebar.subheader("Gold Rate API")
     api_source = st.sidebar.selectbox("Source", ["free", "paid"], index=0)
     api_key = st.sidebar.text_input("API Key (free or paid)", type="password")
-    base_currency = st.sidebar.selectbox("Base Currency", ["INR", "USD", "AED", "EUR"], index=0)
+    race_fetch = st.sidebar.checkbox("Race both providers (fastest wins)", value=False)
+    base_currency = st.sidebar.selectbox("Base Currency", _CURRENCIES, index=0)
     st.sidebar.subheader("Business Parameters")
     making_pct = st.sidebar.slider("Making % of gold value", 0.0, 30.0, 12.0, 0.5)
     making_min = st.sidebar.number_input("Making minimum (absolute)", 0.0, 10000.0, 500.0, 50.0)
@@ -153,7 +396,23 @@ def sidebar_config():
     discount_pct = st.sidebar.slider("Discount %", 0.0, 20.0, 0.0, 0.5)
     gst_pct = st.sidebar.slider("GST %", 0.0, 18.0, 3.0, 0.5)
     final_lock_band = st.sidebar.number_input("Final lock band", 0.0, 10000.0, 0.0, 10.0)
-    return locals()
+    return {
+        "lang_code": lang_code,
+        "api_source": api_source,
+        "api_key": api_key,
+        "race_fetch": race_fetch,
+        "base_currency": base_currency,
+        "making_pct": making_pct,
+        "making_min": making_min,
+        "hallmarking": hallmarking,
+        "shipping": shipping,
+        "certification": certification,
+        "conversion": conversion,
+        "insurance_pct": insurance_pct,
+        "discount_pct": discount_pct,
+        "gst_pct": gst_pct,
+        "final_lock_band": final_lock_band,
+    }
 
 
 def main():
@@ -166,51 +425,58 @@ def main():
         "Home", "Quotation", "Catalogue", "Upload & OCR", "Testimonials/Info"
     ])
 
+    rate = fetch_gold_rate({
+        "source": cfg['api_source'],
+        "api_key": cfg['api_key'],
+        "race": cfg['race_fetch'],
+        "base_currency": cfg['base_currency']
+    })
+
     with tab_home:
-        rate = fetch_gold_rate({
-            "source": cfg['api_source'],
-            "api_key": cfg['api_key'],
-            "base_currency": cfg['base_currency']
-        })
         st.metric("Gold Rate per gram", format_money(rate['per_gram'] or 6000, cfg['base_currency']))
-        st.json(rate['meta'])
+        st.json({**rate['meta'],
+                 "timestamp": datetime.utcfromtimestamp(rate['meta']['ts']).isoformat()})
 
     with tab_catalogue:
         cat = load_public_catalogue()
-        st.dataframe(cat, use_container_width=True)
+        thumb_cols = st.columns(len(cat))
+        for col, sku in zip(thumb_cols, cat.index):
+            data = _thumb(cat.at[sku, 'Image'])
+            if data:
+                col.image(data, caption=sku, width=150)
+        st.dataframe(cat, use_container_width=True, hide_index=True)
 
     with tab_quote:
         cat = load_public_catalogue()
-        sku = st.selectbox("Choose SKU (optional)", ["-"] + cat['SKU'].tolist())
+        sku = st.selectbox("Choose SKU (optional)", ["-"] + cat.index.tolist())
         if sku != "-":
-            row = cat[cat['SKU'] == sku].iloc[0]
+            row = cat.loc[sku]
             weight_default = float(row['Weight_g'])
             karat_default = int(row['Karat'])
         else:
             weight_default = 10.0
             karat_default = 22
         weight = st.number_input("Weight (g)", 0.1, 1000.0, weight_default, 0.1)
-        karat = st.selectbox("Karat", [24,22,20,18,14], index=[24,22,20,18,14].index(karat_default))
+        karat = st.selectbox("Karat", KARAT_CHOICES, index=_KARAT_IDX.get(karat_default, 1))
         stone_cost = st.number_input("Stone cost", 0.0, 100000.0, 0.0, 100.0)
-        rate_val = fetch_gold_rate({
-            "source": cfg['api_source'],
-            "api_key": cfg['api_key'],
-            "base_currency": cfg['base_currency']
-        })['per_gram'] or 6000
+        rate_val = rate['per_gram'] or 6000
         pb = compute_price(weight, karat, rate_val,
                            cfg['making_pct'], cfg['making_min'], stone_cost,
                            cfg['hallmarking'], cfg['shipping'], cfg['insurance_pct'],
                            cfg['certification'], cfg['conversion'], cfg['discount_pct'],
                            0.0, cfg['gst_pct'], cfg['final_lock_band'])
         st.subheader("Breakdown")
-        st.table(pd.DataFrame(pb.as_rows()[1:], columns=pb.as_rows()[0]))
-        st.success(f"Final payable: {format_money(pb.parts['Final payable'], cfg['base_currency'])}")
+        rows = pb.as_rows()
+        st.table({"Component": [r[0] for r in rows[1:]],
+                  "Amount": [r[1] for r in rows[1:]]})
+        st.success(f"Final payable: {format_money(pb.final_payable, cfg['base_currency'])}")
 
     with tab_upload:
         up = st.file_uploader("Upload customer or design photo (OCR supported for images)", type=["png","jpg","jpeg","pdf"])
         if up is not None:
             st.info(f"Uploaded: {up.name} ({up.type})")
             if up.type.startswith("image/"):
+                from PIL import Image  # deferred: only pay the import when a preview is shown
                 img = Image.open(up)
                 st.image(img, caption="Preview", use_column_width=True)
             st.write("OCR extraction will be added here (Tesseract optional).")